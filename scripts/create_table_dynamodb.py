@@ -33,5 +33,42 @@ def create_campaigns_table():
     print(f"Estado: {table.table_status}")
     return table
 
+def create_campaign_assets_table():
+    """Crea la tabla de referencias campaña -> asset en DynamoDB"""
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    
+    table = dynamodb.create_table(
+        TableName='campaign-assets',
+        KeySchema=[
+            {
+                'AttributeName': 'campaignId',
+                'KeyType': 'HASH'  # Partition key
+            },
+            {
+                'AttributeName': 'assetHash',
+                'KeyType': 'RANGE'  # Sort key (SHA-256 del contenido)
+            }
+        ],
+        AttributeDefinitions=[
+            {
+                'AttributeName': 'campaignId',
+                'AttributeType': 'S'
+            },
+            {
+                'AttributeName': 'assetHash',
+                'AttributeType': 'S'
+            }
+        ],
+        BillingMode='PAY_PER_REQUEST'  # On-demand pricing
+    )
+    
+    # Esperar a que la tabla se cree
+    table.wait_until_exists()
+    
+    print(f"Tabla '{table.table_name}' creada exitosamente!")
+    print(f"Estado: {table.table_status}")
+    return table
+
 if __name__ == '__main__':
     create_campaigns_table()
+    create_campaign_assets_table()
@@ -4,26 +4,45 @@ This file contains the Lambda functions you can deploy to AWS.
 
 Required configuration:
 - Python 3.11 or higher
-- boto3 (AWS SDK for Python)
-- Environment variables: DYNAMODB_TABLE_NAME, S3_BUCKET_NAME
+- boto3 (AWS SDK for Python), only for the default DynamoDB backend
+- Environment variables: DYNAMODB_TABLE_NAME, S3_BUCKET_NAME, ASSETS_TABLE_NAME
+
+Storage is selected with STORAGE_BACKEND (see storage.py):
+- dynamodb (default): DynamoDB + S3
+- sqlite: embedded SQLite database + local filesystem (SQLITE_PATH, LOCAL_ASSETS_DIR)
 
 For use with DynamoDB, make sure you have a table with:
 - Partition key: id (String)
+
+And an assets table (campaign -> asset references) with:
+- Partition key: campaignId (String)
+- Sort key: assetHash (String)
 """
 
 import json
-import boto3
-import os
+import hashlib
+import time
+from collections import OrderedDict
 from decimal import Decimal
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
+
+from storage import get_asset_repository, get_asset_store, get_campaign_repository
 
 # Configuration
-dynamodb = boto3.resource('dynamodb')
-table_name = os.environ.get('DYNAMODB_TABLE_NAME', 'campaigns')
-table = dynamodb.Table(table_name)
-s3_client = boto3.client('s3')
-bucket_name = os.environ.get('S3_BUCKET_NAME', 'campaign-assets')
+campaign_repository = get_campaign_repository()
+asset_repository = get_asset_repository()
+asset_store = get_asset_store()
+
+# Presigned URLs are requested with a 7-day expiry, but they stop working when
+# the Lambda role's temporary credentials expire. A cached URL is therefore only
+# reused for a short time after signing, and the cache keeps the most recent keys.
+PRESIGNED_URL_EXPIRY = 604800
+PRESIGNED_URL_CACHE_TTL = 900
+PRESIGNED_URL_CACHE_SIZE = 1024
+
+# S3 key -> (presigned URL, reuse-until timestamp), least recently used first
+_presigned_url_cache: 'OrderedDict[str, Tuple[str, float]]' = OrderedDict()
 
 def calculate_gross_margin(investment: float, cost: float, hidden_cost: float) -> float:
     """Calculate gross margin: investment - cost - hidden_cost"""
@@ -37,6 +56,28 @@ def calculate_margin_percentage(margin: float, investment: float) -> float:
     return (margin / investment) * 100
 
 
+def asset_key(file_content: bytes) -> Tuple[str, str]:
+    """Return the SHA-256 digest of the content and its content-addressed S3 key"""
+    digest = hashlib.sha256(file_content).hexdigest()
+    return digest, f"assets/{digest[:2]}/{digest}"
+
+
+def get_presigned_url(s3_key: str) -> str:
+    """Return a presigned GET URL, reusing one signed less than PRESIGNED_URL_CACHE_TTL ago"""
+    now = time.time()
+    cached = _presigned_url_cache.get(s3_key)
+    if cached and now < cached[1]:
+        _presigned_url_cache.move_to_end(s3_key)
+        return cached[0]
+    
+    url = asset_store.generate_url(s3_key, PRESIGNED_URL_EXPIRY)
+    _presigned_url_cache[s3_key] = (url, now + min(PRESIGNED_URL_CACHE_TTL, PRESIGNED_URL_EXPIRY))
+    _presigned_url_cache.move_to_end(s3_key)
+    while len(_presigned_url_cache) > PRESIGNED_URL_CACHE_SIZE:
+        _presigned_url_cache.popitem(last=False)
+    return url
+
+
 def decimal_default(obj):
     """Helper to serialize Decimal to JSON"""
     if isinstance(obj, Decimal):
@@ -174,7 +215,7 @@ def create_campaign(event: Dict[str, Any]) -> Dict[str, Any]:
         'updatedAt': now
     }
     
-    table.put_item(Item=campaign)
+    campaign_repository.put(campaign)
     
     return {
         'statusCode': 201,
@@ -188,8 +229,7 @@ def create_campaign(event: Dict[str, Any]) -> Dict[str, Any]:
 
 def get_all_campaigns(event: Dict[str, Any]) -> Dict[str, Any]:
     """GET /campaigns - Get all campaigns"""
-    response = table.scan()
-    campaigns = response.get('Items', [])
+    campaigns = list(campaign_repository.scan())
     
     return {
         'statusCode': 200,
@@ -203,9 +243,9 @@ def get_all_campaigns(event: Dict[str, Any]) -> Dict[str, Any]:
 
 def get_campaign(campaign_id: str) -> Dict[str, Any]:
     """GET /campaigns/{id} - Get a campaign by ID"""
-    response = table.get_item(Key={'id': campaign_id})
+    campaign = campaign_repository.get({'id': campaign_id})
     
-    if 'Item' not in response:
+    if campaign is None:
         return {
             'statusCode': 404,
             'headers': {
@@ -221,7 +261,7 @@ def get_campaign(campaign_id: str) -> Dict[str, Any]:
             'Content-Type': 'application/json',
             'Access-Control-Allow-Origin': '*'
         },
-        'body': json.dumps(response['Item'], default=decimal_default)
+        'body': json.dumps(campaign, default=decimal_default)
     }
 
 
@@ -230,8 +270,8 @@ def update_campaign(campaign_id: str, event: Dict[str, Any]) -> Dict[str, Any]:
     body = json.loads(event['body'])
     
     # Verify campaign exists
-    response = table.get_item(Key={'id': campaign_id})
-    if 'Item' not in response:
+    campaign = campaign_repository.get({'id': campaign_id})
+    if campaign is None:
         return {
             'statusCode': 404,
             'headers': {
@@ -241,67 +281,78 @@ def update_campaign(campaign_id: str, event: Dict[str, Any]) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Campaign not found'})
         }
     
-    campaign = response['Item']
-    
-    # Update fields
+    # Collect changed fields; only these are written back
+    changes = {}
     if 'name' in body:
-        campaign['name'] = body['name']
+        changes['name'] = body['name']
     if 'customer' in body:
-        campaign['customer'] = body['customer']
+        changes['customer'] = body['customer']
     if 'brandAdvertiser' in body:
-        campaign['brandAdvertiser'] = body['brandAdvertiser']
+        changes['brandAdvertiser'] = body['brandAdvertiser']
     if 'campaignMotto' in body:
-        campaign['campaignMotto'] = body['campaignMotto']
+        changes['campaignMotto'] = body['campaignMotto']
     if 'organizationPublisher' in body:
-        campaign['organizationPublisher'] = body['organizationPublisher']
+        changes['organizationPublisher'] = body['organizationPublisher']
     if 'market' in body:
-        campaign['market'] = body['market']
+        changes['market'] = body['market']
     if 'salesPerson' in body:
-        campaign['salesPerson'] = body['salesPerson']
+        changes['salesPerson'] = body['salesPerson']
     if 'month' in body:
-        campaign['month'] = body['month']
+        changes['month'] = body['month']
     if 'investment' in body:
-        campaign['investment'] = Decimal(str(body['investment']))
+        changes['investment'] = Decimal(str(body['investment']))
     if 'hiddenCost' in body:
-        campaign['hiddenCost'] = Decimal(str(body['hiddenCost']))
+        changes['hiddenCost'] = Decimal(str(body['hiddenCost']))
     if 'cost' in body:
-        campaign['cost'] = Decimal(str(body['cost']))
+        changes['cost'] = Decimal(str(body['cost']))
+    
+    merged = {**campaign, **changes}
     if 'lines' in body:
         lines = []
         for idx, line in enumerate(body['lines']):
             line_investment = line['units'] * line['unitCost']
-            line_margin = calculate_margin_percentage(line_investment - float(campaign['cost']), line_investment)
+            line_margin = calculate_margin_percentage(line_investment - float(merged['cost']), line_investment)
             lines.append({
                 'id': f"{campaign_id}-line-{idx}",
                 'publisher': line.get('publisher', ''),
-                'market': line.get('market', campaign['market']),
+                'market': line.get('market', merged['market']),
                 'format': line.get('format', 'Video'),
                 'units': line['units'],
                 'unitCost': Decimal(str(line['unitCost'])),
                 'investment': Decimal(str(line_investment)),
                 'margin': Decimal(str(line_margin))
             })
-        campaign['lines'] = lines
+        changes['lines'] = lines
     if 'startDate' in body:
-        campaign['startDate'] = body['startDate']
+        changes['startDate'] = body['startDate']
     if 'endDate' in body:
-        campaign['endDate'] = body['endDate']
+        changes['endDate'] = body['endDate']
     if 'status' in body:
-        campaign['status'] = body['status']
+        changes['status'] = body['status']
     
     # Recalculate margin
     gross_margin = calculate_gross_margin(
-        float(campaign['investment']),
-        float(campaign['cost']),
-        float(campaign.get('hiddenCost', 0))
+        float(merged['investment']),
+        float(merged['cost']),
+        float(merged.get('hiddenCost', 0))
     )
-    margin_percentage = calculate_margin_percentage(gross_margin, float(campaign['investment']))
+    margin_percentage = calculate_margin_percentage(gross_margin, float(merged['investment']))
     
-    campaign['grossMargin'] = Decimal(str(gross_margin))
-    campaign['grossMarginPercentage'] = Decimal(str(margin_percentage))
-    campaign['updatedAt'] = datetime.now().isoformat()
+    changes['grossMargin'] = Decimal(str(gross_margin))
+    changes['grossMarginPercentage'] = Decimal(str(margin_percentage))
+    changes['updatedAt'] = datetime.now().isoformat()
     
-    table.put_item(Item=campaign)
+    # Conditional update: fails if the campaign was deleted in the meantime
+    campaign = campaign_repository.update({'id': campaign_id}, changes)
+    if campaign is None:
+        return {
+            'statusCode': 404,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': 'Campaign not found'})
+        }
     
     return {
         'statusCode': 200,
@@ -316,8 +367,7 @@ def update_campaign(campaign_id: str, event: Dict[str, Any]) -> Dict[str, Any]:
 def delete_campaign(campaign_id: str) -> Dict[str, Any]:
     """DELETE /campaigns/{id} - Delete a campaign"""
     # Verify it exists
-    response = table.get_item(Key={'id': campaign_id})
-    if 'Item' not in response:
+    if campaign_repository.get({'id': campaign_id}) is None:
         return {
             'statusCode': 404,
             'headers': {
@@ -327,7 +377,7 @@ def delete_campaign(campaign_id: str) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Campaign not found'})
         }
     
-    table.delete_item(Key={'id': campaign_id})
+    campaign_repository.delete({'id': campaign_id})
     
     return {
         'statusCode': 200,
@@ -387,28 +437,27 @@ def upload_file_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'error': 'Invalid file type'})
             }
         
-        # Generate S3 key
-        timestamp = int(datetime.now().timestamp() * 1000)
-        s3_key = f"{file_type}/{campaign_id}/{timestamp}-{file_name}"
+        # Content-addressed S3 key: identical bytes map to the same object
+        asset_hash, s3_key = asset_key(file_content)
         
-        # Upload to S3
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=s3_key,
-            Body=file_content,
-            ContentType=content_type,
-            Metadata={
-                'campaign-id': campaign_id,
-                'file-type': file_type
-            }
-        )
+        # Store the bytes only if they are not stored yet
+        deduplicated = asset_store.exists(s3_key)
+        if not deduplicated:
+            asset_store.put(s3_key, file_content, content_type, {'sha256': asset_hash})
+        
+        # Record the campaign -> asset reference
+        asset_repository.put({
+            'campaignId': campaign_id,
+            'assetHash': asset_hash,
+            'key': s3_key,
+            'fileName': file_name,
+            'fileType': file_type,
+            'contentType': content_type,
+            'size': len(file_content),
+            'createdAt': datetime.now().isoformat()
+        })
         
-        # Generate presigned URL (valid for 7 days)
-        url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': bucket_name, 'Key': s3_key},
-            ExpiresIn=604800
-        )
+        url = get_presigned_url(s3_key)
         
         return {
             'statusCode': 201,
@@ -419,8 +468,10 @@ def upload_file_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({
                 'url': url,
                 'key': s3_key,
+                'sha256': asset_hash,
                 'size': len(file_content),
-                'contentType': content_type
+                'contentType': content_type,
+                'deduplicated': deduplicated
             })
         }
         
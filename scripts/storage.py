@@ -0,0 +1,473 @@
+"""
+Storage backends for Campaign Manager Pro
+The Lambda handlers talk to a Repository (items) and an AssetStore (files)
+instead of using boto3 directly, so the API can run on AWS or on a single node.
+
+Backends (STORAGE_BACKEND environment variable):
+- dynamodb (default): DynamoDB tables + S3 bucket
+- sqlite: SQLite database in WAL mode + local filesystem
+
+SQLite configuration:
+- SQLITE_PATH: database file (default: campaigns.db)
+- LOCAL_ASSETS_DIR: directory for uploaded files (default: assets)
+- LOCAL_ASSETS_BASE_URL: optional URL prefix used to serve the files
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from decimal import Decimal
+from pathlib import Path
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+
+# Table layouts shared by every backend
+CAMPAIGNS_KEY = ['id']
+CAMPAIGNS_INDEXES = ['status', 'month', 'market', 'startDate', 'endDate']
+CAMPAIGN_ASSETS_KEY = ['campaignId', 'assetHash']
+
+# DynamoDB global secondary indexes: attribute -> index name
+CAMPAIGNS_DYNAMODB_INDEXES = {'createdAt': 'createdAt-index'}
+
+
+class Repository(ABC):
+    """
+    Item storage interface used by the handlers.
+    Keys are dicts of the key attributes, e.g. {'id': '123'}.
+    """
+
+    @abstractmethod
+    def get(self, key: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return the item for key, or None if it does not exist"""
+
+    @abstractmethod
+    def put(self, item: Dict[str, Any]) -> None:
+        """Create or replace an item"""
+
+    @abstractmethod
+    def update(self, key: Dict[str, Any], changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Set the given attributes on an existing item and return it, or None if missing"""
+
+    @abstractmethod
+    def delete(self, key: Dict[str, Any]) -> None:
+        """Delete an item (no-op if it does not exist)"""
+
+    @abstractmethod
+    def query(self, field: str, value: Any) -> List[Dict[str, Any]]:
+        """
+        Return all items whose attribute equals value.
+        Uses the key or an index when one covers the attribute, otherwise scans.
+        """
+
+    @abstractmethod
+    def batch_put(self, items: Iterable[Dict[str, Any]]) -> None:
+        """Create or replace many items in as few round trips as possible"""
+
+    @abstractmethod
+    def scan(self) -> Iterator[Dict[str, Any]]:
+        """Stream every item without loading the whole table in memory"""
+
+
+class AssetStore(ABC):
+    """File storage interface used by the upload handler"""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """Check whether an object is already stored under key"""
+
+    @abstractmethod
+    def put(self, key: str, body: bytes, content_type: str, metadata: Dict[str, str]) -> None:
+        """Store the bytes under key"""
+
+    @abstractmethod
+    def generate_url(self, key: str, expires_in: int) -> str:
+        """Return a URL to download the object"""
+
+
+# DynamoDB / S3
+
+class DynamoDBRepository(Repository):
+    """Repository backed by a DynamoDB table"""
+
+    def __init__(self, table_name: str, key_fields: List[str], indexes: Optional[Dict[str, str]] = None):
+        import boto3
+
+        self.table = boto3.resource('dynamodb').Table(table_name)
+        self.key_fields = key_fields
+        # attribute -> GSI name
+        self.indexes = indexes or {}
+
+    def get(self, key: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return self.table.get_item(Key=key).get('Item')
+
+    def put(self, item: Dict[str, Any]) -> None:
+        self.table.put_item(Item=item)
+
+    def update(self, key: Dict[str, Any], changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        from botocore.exceptions import ClientError
+
+        # 'SET' with nothing after it is rejected; match SQLite and return the item as is
+        if not changes:
+            return self.get(key)
+
+        names = {f'#f{i}': field for i, field in enumerate(changes)}
+        values = {f':v{i}': value for i, value in enumerate(changes.values())}
+        expression = 'SET ' + ', '.join(f'#f{i} = :v{i}' for i in range(len(changes)))
+        try:
+            response = self.table.update_item(
+                Key=key,
+                UpdateExpression=expression,
+                ConditionExpression=f'attribute_exists({self.key_fields[0]})',
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+                ReturnValues='ALL_NEW'
+            )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return None
+            raise
+        return response.get('Attributes')
+
+    def delete(self, key: Dict[str, Any]) -> None:
+        self.table.delete_item(Key=key)
+
+    def query(self, field: str, value: Any) -> List[Dict[str, Any]]:
+        from boto3.dynamodb.conditions import Attr, Key
+
+        if field == self.key_fields[0]:
+            kwargs = {'KeyConditionExpression': Key(field).eq(value)}
+            operation = self.table.query
+        elif field in self.indexes:
+            kwargs = {'IndexName': self.indexes[field], 'KeyConditionExpression': Key(field).eq(value)}
+            operation = self.table.query
+        else:
+            kwargs = {'FilterExpression': Attr(field).eq(value)}
+            operation = self.table.scan
+
+        items = []
+        while True:
+            response = operation(**kwargs)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return items
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def batch_put(self, items: Iterable[Dict[str, Any]]) -> None:
+        with self.table.batch_writer() as batch:
+            for item in items:
+                batch.put_item(Item=item)
+
+    def scan(self) -> Iterator[Dict[str, Any]]:
+        kwargs = {}
+        while True:
+            response = self.table.scan(**kwargs)
+            yield from response.get('Items', [])
+            if 'LastEvaluatedKey' not in response:
+                return
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+class S3AssetStore(AssetStore):
+    """AssetStore backed by an S3 bucket"""
+
+    def __init__(self, bucket_name: str):
+        import boto3
+
+        self.s3_client = boto3.client('s3')
+        self.bucket_name = bucket_name
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.s3_client.head_object(Bucket=self.bucket_name, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def put(self, key: str, body: bytes, content_type: str, metadata: Dict[str, str]) -> None:
+        self.s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key=key,
+            Body=body,
+            ContentType=content_type,
+            Metadata=metadata
+        )
+
+    def generate_url(self, key: str, expires_in: int) -> str:
+        return self.s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket_name, 'Key': key},
+            ExpiresIn=expires_in
+        )
+
+
+# SQLite / local filesystem
+
+def _dump_document(obj: Any) -> str:
+    """
+    Serialize an item to JSON, writing Decimal (DynamoDB number type) as its
+    exact digits instead of going through float
+    """
+    if isinstance(obj, Decimal):
+        if not obj.is_finite():
+            raise ValueError(f'Number is not finite: {obj}')
+        return str(obj)
+    if isinstance(obj, dict):
+        return '{' + ', '.join(f'{json.dumps(str(k))}: {_dump_document(v)}' for k, v in obj.items()) + '}'
+    if isinstance(obj, (list, tuple)):
+        return '[' + ', '.join(_dump_document(v) for v in obj) + ']'
+    return json.dumps(obj)
+
+
+_sqlite_connections: Dict[str, sqlite3.Connection] = {}
+_sqlite_connection_locks: Dict[str, threading.RLock] = {}
+_sqlite_lock = threading.Lock()
+
+
+def get_sqlite_connection(path: str) -> sqlite3.Connection:
+    """Return one shared WAL-mode connection per database file"""
+    with _sqlite_lock:
+        if path not in _sqlite_connections:
+            conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            _sqlite_connections[path] = conn
+            _sqlite_connection_locks[path] = threading.RLock()
+        return _sqlite_connections[path]
+
+
+class SQLiteRepository(Repository):
+    """
+    Repository backed by a SQLite table.
+    Items are stored as JSON documents; key and indexed attributes are also
+    copied into their own columns so lookups and filters hit an index.
+    Numbers are stored exactly and read back as Decimal, like boto3 returns
+    them from DynamoDB.
+    """
+
+    def __init__(self, path: str, table_name: str, key_fields: List[str], indexed_fields: Optional[List[str]] = None):
+        self.conn = get_sqlite_connection(path)
+        # Repositories on the same file share the connection, so they share its lock
+        self.lock = _sqlite_connection_locks[path]
+        self.table_name = table_name
+        self.key_fields = key_fields
+        self.indexed_fields = indexed_fields or []
+        self.columns = key_fields + self.indexed_fields
+
+        column_defs = ', '.join(f'"{column}"' for column in self.columns)
+        primary_key = ', '.join(f'"{field}"' for field in key_fields)
+        with self.lock:
+            self.conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table_name}" '
+                f'({column_defs}, doc TEXT NOT NULL, PRIMARY KEY ({primary_key}))'
+            )
+            for field in self.indexed_fields:
+                self.conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS "idx_{table_name}_{field}" ON "{table_name}" ("{field}")'
+                )
+
+        placeholders = ', '.join('?' for _ in range(len(self.columns) + 1))
+        # ON CONFLICT updates in place and keeps the rowid, which scan pages by
+        # (INSERT OR REPLACE would move a rewritten item past the scan cursor)
+        assignments = ', '.join(
+            f'"{column}" = excluded."{column}"' for column in self.indexed_fields + ['doc']
+        )
+        self.upsert_sql = (
+            f'INSERT INTO "{table_name}" ({column_defs}, doc) VALUES ({placeholders}) '
+            f'ON CONFLICT ({primary_key}) DO UPDATE SET {assignments}'
+        )
+        self.key_where = ' AND '.join(f'"{field}" = ?' for field in key_fields)
+
+    def _row(self, item: Dict[str, Any]) -> List[Any]:
+        values = [item.get(column) for column in self.columns]
+        values = [float(v) if isinstance(v, Decimal) else v for v in values]
+        return values + [_dump_document(item)]
+
+    def _key_values(self, key: Dict[str, Any]) -> List[Any]:
+        return [key[field] for field in self.key_fields]
+
+    @staticmethod
+    def _load(doc: str) -> Dict[str, Any]:
+        return json.loads(doc, parse_int=Decimal, parse_float=Decimal)
+
+    def get(self, key: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.conn.execute(
+                f'SELECT doc FROM "{self.table_name}" WHERE {self.key_where}',
+                self._key_values(key)
+            ).fetchone()
+        return self._load(row[0]) if row else None
+
+    def put(self, item: Dict[str, Any]) -> None:
+        with self.lock:
+            self.conn.execute(self.upsert_sql, self._row(item))
+
+    def update(self, key: Dict[str, Any], changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.conn.execute(
+                    f'SELECT doc FROM "{self.table_name}" WHERE {self.key_where}',
+                    self._key_values(key)
+                ).fetchone()
+                if row is None:
+                    self.conn.execute('ROLLBACK')
+                    return None
+                item = self._load(row[0])
+                item.update(changes)
+                self.conn.execute(self.upsert_sql, self._row(item))
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+        return item
+
+    def delete(self, key: Dict[str, Any]) -> None:
+        with self.lock:
+            self.conn.execute(
+                f'DELETE FROM "{self.table_name}" WHERE {self.key_where}',
+                self._key_values(key)
+            )
+
+    def query(self, field: str, value: Any) -> List[Dict[str, Any]]:
+        if field not in self.columns:
+            return [item for item in self.scan() if item.get(field) == value]
+
+        if isinstance(value, Decimal):
+            value = float(value)
+        with self.lock:
+            rows = self.conn.execute(
+                f'SELECT doc FROM "{self.table_name}" WHERE "{field}" = ?',
+                (value,)
+            ).fetchall()
+        return [self._load(row[0]) for row in rows]
+
+    def batch_put(self, items: Iterable[Dict[str, Any]]) -> None:
+        with self.lock:
+            self.conn.execute('BEGIN')
+            try:
+                self.conn.executemany(self.upsert_sql, (self._row(item) for item in items))
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    def scan(self, page_size: int = 500) -> Iterator[Dict[str, Any]]:
+        # Page by rowid so the lock is not held while the caller consumes items
+        last_rowid = 0
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    f'SELECT rowid, doc FROM "{self.table_name}" WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                    (last_rowid, page_size)
+                ).fetchall()
+            for rowid, doc in rows:
+                yield self._load(doc)
+            if len(rows) < page_size:
+                return
+            last_rowid = rows[-1][0]
+
+
+# Permissions of stored asset files (what write_bytes gives under the usual 022 umask)
+ASSET_FILE_MODE = 0o644
+
+
+class LocalAssetStore(AssetStore):
+    """AssetStore backed by a local directory"""
+
+    def __init__(self, root: str, base_url: Optional[str] = None):
+        self.root = Path(root).resolve()
+        self.base_url = base_url.rstrip('/') if base_url else None
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root not in path.parents:
+            raise ValueError(f'Invalid asset key: {key}')
+        return path
+
+    def exists(self, key: str) -> bool:
+        return self._path(key).is_file()
+
+    def put(self, key: str, body: bytes, content_type: str, metadata: Dict[str, str]) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a unique temp file first so readers never see a partial object
+        # and concurrent writers of the same key don't share a temp path
+        tmp = tempfile.NamedTemporaryFile(dir=path.parent, prefix=f'.{path.name}.', delete=False)
+        try:
+            with tmp:
+                tmp.write(body)
+            # NamedTemporaryFile is 0600; assets must be readable by a static file server
+            os.chmod(tmp.name, ASSET_FILE_MODE)
+            os.replace(tmp.name, path)
+        except Exception:
+            os.unlink(tmp.name)
+            raise
+
+    def generate_url(self, key: str, expires_in: int) -> str:
+        if self.base_url:
+            return f'{self.base_url}/{key}'
+        return self._path(key).as_uri()
+
+
+# Backend selection
+
+def storage_backend() -> str:
+    """Name of the configured backend (STORAGE_BACKEND, default: dynamodb)"""
+    return os.environ.get('STORAGE_BACKEND', 'dynamodb')
+
+
+def get_campaign_repository() -> Repository:
+    """Repository for campaigns, selected by STORAGE_BACKEND"""
+    backend = storage_backend()
+    if backend == 'dynamodb':
+        # Only createdAt has a GSI in the CloudFormation template; queries on
+        # other attributes fall back to a filtered scan on this backend
+        return DynamoDBRepository(
+            os.environ.get('DYNAMODB_TABLE_NAME', 'campaigns'),
+            CAMPAIGNS_KEY,
+            CAMPAIGNS_DYNAMODB_INDEXES
+        )
+    if backend == 'sqlite':
+        return SQLiteRepository(
+            os.environ.get('SQLITE_PATH', 'campaigns.db'),
+            'campaigns',
+            CAMPAIGNS_KEY,
+            CAMPAIGNS_INDEXES
+        )
+    raise ValueError(f'Unknown storage backend: {backend}')
+
+
+def get_asset_repository() -> Repository:
+    """Repository for campaign -> asset references, selected by STORAGE_BACKEND"""
+    backend = storage_backend()
+    if backend == 'dynamodb':
+        return DynamoDBRepository(
+            os.environ.get('ASSETS_TABLE_NAME', 'campaign-assets'),
+            CAMPAIGN_ASSETS_KEY
+        )
+    if backend == 'sqlite':
+        return SQLiteRepository(
+            os.environ.get('SQLITE_PATH', 'campaigns.db'),
+            'campaign_assets',
+            CAMPAIGN_ASSETS_KEY
+        )
+    raise ValueError(f'Unknown storage backend: {backend}')
+
+
+def get_asset_store() -> AssetStore:
+    """Asset file store, selected by STORAGE_BACKEND"""
+    backend = storage_backend()
+    if backend == 'dynamodb':
+        return S3AssetStore(os.environ.get('S3_BUCKET_NAME', 'campaign-assets'))
+    if backend == 'sqlite':
+        return LocalAssetStore(
+            os.environ.get('LOCAL_ASSETS_DIR', 'assets'),
+            os.environ.get('LOCAL_ASSETS_BASE_URL')
+        )
+    raise ValueError(f'Unknown storage backend: {backend}')
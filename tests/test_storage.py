@@ -0,0 +1,432 @@
+"""
+Storage backend tests for Campaign Manager Pro
+Uses the SQLite backend, so no AWS account is needed.
+The S3 asset store tests use a stub client and are skipped without boto3.
+Run with: python -m pytest tests/
+"""
+
+import base64
+import hashlib
+import importlib
+import json
+import os
+import sys
+import threading
+from decimal import Decimal
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import storage
+
+
+@pytest.fixture
+def repository(tmp_path):
+    """Campaigns repository on a fresh SQLite database"""
+    return storage.SQLiteRepository(
+        str(tmp_path / 'campaigns.db'),
+        'campaigns',
+        storage.CAMPAIGNS_KEY,
+        storage.CAMPAIGNS_INDEXES
+    )
+
+
+@pytest.fixture
+def lambda_functions(tmp_path, monkeypatch):
+    """Lambda module configured for the SQLite backend"""
+    monkeypatch.setenv('STORAGE_BACKEND', 'sqlite')
+    monkeypatch.setenv('SQLITE_PATH', str(tmp_path / 'campaigns.db'))
+    monkeypatch.setenv('LOCAL_ASSETS_DIR', str(tmp_path / 'assets'))
+    sys.modules.pop('lambda_functions', None)
+    return importlib.import_module('lambda_functions')
+
+
+class StubS3Client:
+    """Minimal S3 client recording calls; HEAD answers with head_error when set"""
+
+    def __init__(self, stored=(), head_error=None):
+        self.stored = set(stored)
+        self.head_error = head_error
+        self.puts = []
+        self.signed = 0
+
+    def head_object(self, Bucket, Key):
+        from botocore.exceptions import ClientError
+
+        if self.head_error:
+            raise ClientError({'Error': {'Code': self.head_error}}, 'HeadObject')
+        if Key not in self.stored:
+            raise ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+        return {}
+
+    def put_object(self, Bucket, Key, Body, ContentType, Metadata):
+        self.puts.append(Key)
+        self.stored.add(Key)
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        self.signed += 1
+        return f"https://{Params['Bucket']}.s3.amazonaws.com/{Params['Key']}?sig={self.signed}"
+
+
+def use_s3_stub(lambda_functions, monkeypatch, stub):
+    """Point the handlers at an S3AssetStore backed by stub"""
+    boto3 = pytest.importorskip('boto3')
+    monkeypatch.setattr(boto3, 'client', lambda *args, **kwargs: stub)
+    monkeypatch.setattr(lambda_functions, 'asset_store', storage.S3AssetStore('campaign-assets'))
+
+
+def upload_body(content=b'logo-bytes', campaign_id='1'):
+    return {'body': json.dumps({
+        'fileContent': base64.b64encode(content).decode(),
+        'fileName': 'logo.png',
+        'campaignId': campaign_id,
+        'contentType': 'image/png'
+    })}
+
+
+def make_campaign(campaign_id, **overrides):
+    campaign = {
+        'id': campaign_id,
+        'name': 'Test Campaign',
+        'market': 'Brazil',
+        'month': 'Jan',
+        'status': 'Active',
+        'investment': Decimal('10236.82'),
+        'startDate': '2025-01-01',
+        'endDate': '2025-01-31'
+    }
+    campaign.update(overrides)
+    return campaign
+
+
+class TestInterfaces:
+    """Test the storage interfaces"""
+
+    def test_incomplete_backend_rejected(self):
+        """Test a backend missing methods fails when it is created"""
+        class PartialRepository(storage.Repository):
+            def get(self, key):
+                return None
+
+        with pytest.raises(TypeError):
+            PartialRepository()
+
+
+class StubDynamoDBTable:
+    """Minimal DynamoDB table recording update_item calls"""
+
+    def __init__(self, items):
+        self.items = items
+        self.updates = []
+
+    def get_item(self, Key):
+        item = self.items.get(Key['id'])
+        return {'Item': item} if item else {}
+
+    def update_item(self, **kwargs):
+        self.updates.append(kwargs)
+        return {'Attributes': self.items[kwargs['Key']['id']]}
+
+
+class TestDynamoDBRepository:
+    """Test the DynamoDB repository against a stub table"""
+
+    def test_update_without_changes(self, monkeypatch):
+        """Test an empty update returns the item without calling UpdateItem"""
+        boto3 = pytest.importorskip('boto3')
+        table = StubDynamoDBTable({'1': make_campaign('1')})
+
+        class StubResource:
+            def Table(self, name):
+                return table
+
+        monkeypatch.setattr(boto3, 'resource', lambda *args, **kwargs: StubResource())
+        repository = storage.DynamoDBRepository('campaigns', storage.CAMPAIGNS_KEY)
+
+        assert repository.update({'id': '1'}, {}) == make_campaign('1')
+        assert repository.update({'id': 'missing'}, {}) is None
+        assert table.updates == []
+
+
+class TestSQLiteRepository:
+    """Test the SQLite repository"""
+
+    def test_put_and_get(self, repository):
+        """Test items round-trip with numbers read back as Decimal"""
+        repository.put(make_campaign('1'))
+
+        item = repository.get({'id': '1'})
+        assert item['name'] == 'Test Campaign'
+        assert item['investment'] == Decimal('10236.82')
+        assert repository.get({'id': 'missing'}) is None
+
+    def test_numbers_round_trip_exactly(self, repository):
+        """Test Decimals keep all their digits and integers come back as Decimal"""
+        repository.put(make_campaign(
+            '1',
+            investment=Decimal('12345678901234567.89'),
+            cost=Decimal('10'),
+            lines=[{'units': 68820, 'unitCost': Decimal('0.15')}]
+        ))
+
+        item = repository.get({'id': '1'})
+        assert str(item['investment']) == '12345678901234567.89'
+        assert str(item['cost']) == '10'
+        assert isinstance(item['lines'][0]['units'], Decimal)
+        assert item['lines'][0]['units'] == 68820
+        assert str(item['lines'][0]['unitCost']) == '0.15'
+
+    def test_update(self, repository):
+        """Test update merges attributes and reports missing items"""
+        repository.put(make_campaign('1'))
+
+        item = repository.update({'id': '1'}, {'status': 'Paused'})
+        assert item['status'] == 'Paused'
+        assert repository.query('status', 'Paused')[0]['id'] == '1'
+        assert repository.update({'id': 'missing'}, {'status': 'Paused'}) is None
+
+    def test_update_without_changes(self, repository):
+        """Test an empty update returns the item unchanged, or None if missing"""
+        repository.put(make_campaign('1'))
+
+        assert repository.update({'id': '1'}, {}) == repository.get({'id': '1'})
+        assert repository.update({'id': 'missing'}, {}) is None
+
+    def test_delete(self, repository):
+        """Test delete removes the item"""
+        repository.put(make_campaign('1'))
+        repository.delete({'id': '1'})
+
+        assert repository.get({'id': '1'}) is None
+
+    def test_query_indexed_and_unindexed(self, repository):
+        """Test query on indexed columns and on plain attributes"""
+        repository.batch_put([
+            make_campaign('1', market='Brazil'),
+            make_campaign('2', market='Mexico'),
+            make_campaign('3', market='Brazil', name='Other')
+        ])
+
+        assert sorted(c['id'] for c in repository.query('market', 'Brazil')) == ['1', '3']
+        assert [c['id'] for c in repository.query('name', 'Other')] == ['3']
+
+    def test_scan_streams_all_pages(self, repository):
+        """Test scan yields every item across pages"""
+        repository.batch_put(make_campaign(str(i)) for i in range(25))
+
+        assert len(list(repository.scan(page_size=10))) == 25
+
+    def test_scan_unaffected_by_concurrent_writes(self, repository):
+        """Test items rewritten during a scan are not returned twice"""
+        repository.batch_put(make_campaign(str(i)) for i in range(25))
+
+        seen = []
+        for item in repository.scan(page_size=10):
+            seen.append(item['id'])
+            if item['id'] == '0':
+                repository.put(make_campaign('0', status='Paused'))
+                repository.update({'id': '1'}, {'status': 'Paused'})
+
+        assert sorted(seen) == sorted(str(i) for i in range(25))
+
+
+class TestLocalAssetStore:
+    """Test the local filesystem asset store"""
+
+    def test_put_and_exists(self, tmp_path):
+        """Test stored objects are found by key"""
+        store = storage.LocalAssetStore(str(tmp_path))
+        assert not store.exists('assets/ab/abc')
+
+        store.put('assets/ab/abc', b'data', 'image/png', {})
+        assert store.exists('assets/ab/abc')
+        assert (tmp_path / 'assets' / 'ab' / 'abc').read_bytes() == b'data'
+
+    def test_stored_file_readable(self, tmp_path):
+        """Test stored files get 0644 so a separate static server can read them"""
+        store = storage.LocalAssetStore(str(tmp_path))
+        store.put('assets/ab/abc', b'data', 'image/png', {})
+
+        assert (tmp_path / 'assets' / 'ab' / 'abc').stat().st_mode & 0o777 == 0o644
+
+    def test_failed_write_leaves_no_temp_file(self, tmp_path, monkeypatch):
+        """Test the temp file is removed when storing fails"""
+        store = storage.LocalAssetStore(str(tmp_path))
+
+        def fail_chmod(path, mode):
+            raise OSError('chmod failed')
+
+        monkeypatch.setattr(storage.os, 'chmod', fail_chmod)
+        with pytest.raises(OSError):
+            store.put('assets/ab/abc', b'data', 'image/png', {})
+        assert list((tmp_path / 'assets' / 'ab').iterdir()) == []
+
+    def test_concurrent_puts_of_same_key(self, tmp_path):
+        """Test threads storing the same content at once all succeed"""
+        store = storage.LocalAssetStore(str(tmp_path))
+        errors = []
+
+        def put():
+            try:
+                for _ in range(20):
+                    store.put('assets/ab/abc', b'data', 'image/png', {})
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=put) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert (tmp_path / 'assets' / 'ab' / 'abc').read_bytes() == b'data'
+        assert [p.name for p in (tmp_path / 'assets' / 'ab').iterdir()] == ['abc']
+
+    def test_key_outside_root_rejected(self, tmp_path):
+        """Test keys cannot escape the asset directory"""
+        store = storage.LocalAssetStore(str(tmp_path / 'assets'))
+
+        with pytest.raises(ValueError):
+            store.put('../outside', b'data', 'image/png', {})
+
+
+class TestContentAddressedAssets:
+    """Test content-addressed keys, the S3 dedup check and presigned URL caching"""
+
+    def test_asset_key(self, lambda_functions):
+        """Test the key is derived from the SHA-256 of the content"""
+        digest = hashlib.sha256(b'logo-bytes').hexdigest()
+
+        assert lambda_functions.asset_key(b'logo-bytes') == (digest, f'assets/{digest[:2]}/{digest}')
+        assert lambda_functions.asset_key(b'other')[1] != lambda_functions.asset_key(b'logo-bytes')[1]
+
+    def test_put_skipped_when_head_finds_object(self, lambda_functions, monkeypatch):
+        """Test existing content is not uploaded again"""
+        _, key = lambda_functions.asset_key(b'logo-bytes')
+        stub = StubS3Client(stored=[key])
+        use_s3_stub(lambda_functions, monkeypatch, stub)
+
+        response = lambda_functions.upload_file_handler(upload_body(), None)
+        assert response['statusCode'] == 201
+        assert json.loads(response['body'])['deduplicated']
+        assert stub.puts == []
+
+    def test_put_when_head_returns_404(self, lambda_functions, monkeypatch):
+        """Test new content is uploaded once"""
+        stub = StubS3Client()
+        use_s3_stub(lambda_functions, monkeypatch, stub)
+
+        response = lambda_functions.upload_file_handler(upload_body(), None)
+        assert not json.loads(response['body'])['deduplicated']
+        assert stub.puts == [lambda_functions.asset_key(b'logo-bytes')[1]]
+
+    def test_head_403_is_raised(self, lambda_functions, monkeypatch):
+        """Test a 403 from HEAD is not mistaken for a missing object"""
+        stub = StubS3Client(head_error='403')
+        use_s3_stub(lambda_functions, monkeypatch, stub)
+        from botocore.exceptions import ClientError
+
+        with pytest.raises(ClientError):
+            lambda_functions.asset_store.exists('assets/ab/abc')
+        assert lambda_functions.upload_file_handler(upload_body(), None)['statusCode'] == 500
+        assert stub.puts == []
+
+    def test_presigned_url_reused_only_within_cache_ttl(self, lambda_functions, monkeypatch):
+        """Test a cached URL is re-signed once PRESIGNED_URL_CACHE_TTL has passed"""
+        stub = StubS3Client()
+        use_s3_stub(lambda_functions, monkeypatch, stub)
+        ttl = lambda_functions.PRESIGNED_URL_CACHE_TTL
+        assert ttl < lambda_functions.PRESIGNED_URL_EXPIRY
+
+        monkeypatch.setattr(lambda_functions.time, 'time', lambda: 0)
+        first = lambda_functions.get_presigned_url('assets/ab/abc')
+
+        monkeypatch.setattr(lambda_functions.time, 'time', lambda: ttl - 1)
+        assert lambda_functions.get_presigned_url('assets/ab/abc') == first
+        assert stub.signed == 1
+
+        monkeypatch.setattr(lambda_functions.time, 'time', lambda: ttl)
+        assert lambda_functions.get_presigned_url('assets/ab/abc') != first
+        assert stub.signed == 2
+
+    def test_presigned_url_cache_is_bounded(self, lambda_functions, monkeypatch):
+        """Test the least recently used URL is evicted once the cache is full"""
+        stub = StubS3Client()
+        use_s3_stub(lambda_functions, monkeypatch, stub)
+        monkeypatch.setattr(lambda_functions, 'PRESIGNED_URL_CACHE_SIZE', 2)
+
+        lambda_functions.get_presigned_url('a')
+        lambda_functions.get_presigned_url('b')
+        lambda_functions.get_presigned_url('a')
+        lambda_functions.get_presigned_url('c')
+
+        assert list(lambda_functions._presigned_url_cache) == ['a', 'c']
+        lambda_functions.get_presigned_url('b')
+        assert stub.signed == 4
+
+class TestHandlersOnSQLite:
+    """Test the Lambda handlers end to end on the SQLite backend"""
+
+    def test_campaign_crud(self, lambda_functions):
+        """Test create, get, update, list and delete"""
+        body = {
+            'name': 'Test Campaign', 'customer': 'Test Customer', 'brandAdvertiser': 'Test Brand',
+            'organizationPublisher': 'Test Publisher', 'market': 'Brazil', 'salesPerson': 'John Doe',
+            'month': 'Jan', 'investment': 10000, 'cost': 5000, 'startDate': '2025-01-01',
+            'endDate': '2025-01-31', 'status': 'Active'
+        }
+        created = lambda_functions.lambda_handler(
+            {'httpMethod': 'POST', 'path': '/campaigns', 'body': json.dumps(body)}, None
+        )
+        assert created['statusCode'] == 201
+        campaign_id = json.loads(created['body'])['id']
+        path = {'pathParameters': {'id': campaign_id}, 'path': f'/campaigns/{campaign_id}'}
+
+        updated = lambda_functions.lambda_handler(
+            {'httpMethod': 'PUT', 'body': json.dumps({'cost': 6000}), **path}, None
+        )
+        assert json.loads(updated['body'])['grossMargin'] == 4000
+
+        listed = lambda_functions.lambda_handler({'httpMethod': 'GET', 'path': '/campaigns'}, None)
+        assert [c['id'] for c in json.loads(listed['body'])] == [campaign_id]
+
+        deleted = lambda_functions.lambda_handler({'httpMethod': 'DELETE', **path}, None)
+        assert deleted['statusCode'] == 200
+
+        missing = lambda_functions.lambda_handler({'httpMethod': 'GET', **path}, None)
+        assert missing['statusCode'] == 404
+
+    def test_update_does_not_recreate_deleted_campaign(self, lambda_functions, monkeypatch):
+        """Test an update racing a delete returns 404 instead of writing the item back"""
+        repository = lambda_functions.campaign_repository
+        repository.put(make_campaign('1', cost=Decimal('5000')))
+        original_get = repository.get
+
+        def get_then_delete(key):
+            item = original_get(key)
+            repository.delete(key)
+            return item
+
+        monkeypatch.setattr(repository, 'get', get_then_delete)
+        response = lambda_functions.update_campaign('1', {'body': json.dumps({'status': 'Paused'})})
+
+        assert response['statusCode'] == 404
+        assert original_get({'id': '1'}) is None
+
+    def test_upload_deduplicates_content(self, lambda_functions):
+        """Test the same file uploaded for two campaigns is stored once"""
+        def upload(campaign_id):
+            response = lambda_functions.upload_file_handler(upload_body(campaign_id=campaign_id), None)
+            assert response['statusCode'] == 201
+            return json.loads(response['body'])
+
+        first = upload('1')
+        second = upload('2')
+
+        assert first['key'] == second['key']
+        assert not first['deduplicated']
+        assert second['deduplicated']
+        assert second['url'] == first['url']
+        assert lambda_functions.asset_repository.query('campaignId', '2')[0]['assetHash'] == first['sha256']